@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 import ollama
 import argparse
-import json
 import sys
 import asyncio
+import atexit
+import gzip
+import hashlib
+import math
+import os
+import re
 import httpx
-from bs4 import BeautifulSoup
-from termcolor import cprint
+import msgspec
+import orjson
+from selectolax.lexbor import LexborHTMLParser
 from datetime import datetime
 from googlesearch import search as google_search
 import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Union
+from urllib.parse import unquote_plus, urlparse, urlunparse
+from async_lru import alru_cache
 
 # --- System Prompts ---
 EXPERT_SYSTEM_PROMPT = """
@@ -22,11 +33,12 @@ Your workflow for each user query is as follows:
 2.  **Act with Tools**: If you need more information, choose the best tool for the job. You must respond with a single JSON object to use a tool.
     - `search_web(query, reason)`: Use search engine to get search results for webpages that contain current information or verify facts on the web. Search results only include title, description, and URL only and you must call `read_webpage`on two or more URLs to get and understand their full content.
     - `read_webpage(url, reason)`: Read the webpage specified by the URL to get more information about one of the search results. This is necessary because `search_web` only provides titles, descriptions, and URLs.
+    - `read_webpages(urls, reason)`: Read several webpages at once (at most 5 per call; extra URLs are ignored). Prefer this over repeated `read_webpage` calls when you already know which URLs you want to read.
     - `llama_panel(question, reason)`: Ask a specific question to the panel for diverse answers. The panel's information is limited to their training data and information you share in your question.
 3.  **Synthesize and Check**: Once you have gathered sufficient information, synthesize your best answer based on your knowledge and all gathered information. Confirm your complete answer with the panel with `llama_panel(question, reason)`.
 4.  **Finalize**: Considering your answer and panel's feedback, return a final, conclusive answer. You must responsd with a single JSON object using tool `final_answer(answer)`.
 
-Because `search_web` only gives you title, description and URL about each page, you must call `read_webpage` on two or more of the URLs to fetch and understand thier content.
+Because `search_web` only gives you title, description and URL about each page, you must call `read_webpage` on two or more of the URLs (or `read_webpages` with a list of them) to fetch and understand thier content.
 
 For any tool selection, always include a "reason" field explaining why you chose that tool in a single sentence.
 
@@ -36,167 +48,446 @@ You only have 10 steps to reach a final answer. If you cannot reach a consensus
 - `{"tool": "llama_panel", "question": "Your question to the panel", "reason": "Why you chose to consult the panel"}`
 - `{"tool": "search_web", "query": "Your search query", "reason": "Why you chose to search the web"}`
 - `{"tool": "read_webpage", "url": "A specific URL from the search results", "reason": "Why you chose to read this webpage"}`
+- `{"tool": "read_webpages", "urls": ["A URL from the search results", "Another URL from the search results"], "reason": "Why you chose to read these webpages"}`
 - `{"tool": "final_answer", "answer": "Your final, well-reasoned consensus answer."}`
 
 Always respond with one of the Available Responses above in the prescribed JSON format. Response must include "tool" field with the tool name, and "reason" field explaining why you chose that tool in a single sentence.
 """
 
+# Keep the expert loaded between steps so its cached system-prompt prefix survives
+EXPERT_KEEP_ALIVE = '1h'
+
+# --- Tool Calls ---
+
+# Models in JSON mode often send null for an argument they leave empty, so string arguments accept it
+class ToolCall(msgspec.Struct, tag_field="tool"):
+    reason: Optional[str] = None
+
+class LlamaPanel(ToolCall, tag="llama_panel"):
+    question: Optional[str] = ""
+
+class SearchWeb(ToolCall, tag="search_web"):
+    query: Optional[str] = ""
+
+class ReadWebpage(ToolCall, tag="read_webpage"):
+    url: Optional[str] = ""
+
+class ReadWebpages(ToolCall, tag="read_webpages"):
+    urls: Union[list[str], str, None] = []
+
+class FinalAnswer(ToolCall, tag="final_answer"):
+    # Structured answers (objects or lists) are common, so any JSON value is accepted
+    answer: Any = "No answer provided."
+
+# Built once; decodes and validates an expert reply into one of the tool call types above
+_TOOL_CALL_DECODER = msgspec.json.Decoder(Union[LlamaPanel, SearchWeb, ReadWebpage, ReadWebpages, FinalAnswer])
+
 # --- Helper Functions & Classes ---
 
+# ANSI escapes are built once; colors are dropped when NO_COLOR is set or the target stream isn't a terminal
+_NO_COLOR = 'NO_COLOR' in os.environ
+_COLORS = {name: f'\033[{code}m' for name, code in
+           {'red': 31, 'green': 32, 'yellow': 33, 'blue': 34, 'magenta': 35, 'cyan': 36}.items()}
+_BOLD = '\033[1m'
+_RESET = '\033[0m'
+
+def log(msg: str, color: str = 'yellow', bold: bool = False, file=None):
+    file = file or sys.stderr
+    if _NO_COLOR or not file.isatty():
+        file.write(f"{msg}\n")
+    else:
+        file.write(f"{_BOLD if bold else ''}{_COLORS[color]}{msg}{_RESET}\n")
+
+# Dedicated workers for the blocking googlesearch calls, reused across tool invocations.
+# googlesearch.search is a generator that only fetches while it is iterated, so work submitted
+# here must consume it fully (see _google_search) or the HTTP requests end up on the event loop.
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gsearch")
+atexit.register(_SEARCH_POOL.shutdown, wait=False)
+
+# Collapses blank lines and the double-space gaps between inline elements into single line breaks
+_WS_RE = re.compile(r'[ \t]*\n[ \t\n]*|[ ]{2,}')
+
+# One Ollama client for the expert, every panelist and the response cache, so they share a connection pool
+_OLLAMA = ollama.AsyncClient()
+
+# Shared HTTP client so keep-alive connections are reused between read_webpage calls
+_HTTP = httpx.AsyncClient(
+    http2=True,
+    follow_redirects=True,
+    timeout=10,
+    headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'},
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+)
+
+# Download cap per page; inline scripts and styles in <head> can take tens of KB before any body text
+_MAX_PAGE_BYTES = 256 * 1024
+
+# Query parameters that only track the visitor and never change the page content
+_TRACKING_PARAMS = frozenset({'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'fbclid', 'gclid'})
+
+def _normalize_url(url: str) -> str:
+    # The normalized URL is what gets fetched, so only the host is lower-cased (not credentials)
+    # and the query is left byte-for-byte apart from dropping tracking parameters
+    parts = urlparse(url.strip())
+    userinfo, at, hostport = parts.netloc.rpartition('@')
+    query = '&'.join(param for param in parts.query.split('&') if unquote_plus(param.split('=', 1)[0]) not in _TRACKING_PARAMS)
+    return urlunparse(parts._replace(netloc=f"{userinfo}{at}{hostport.lower()}", query=query, fragment=''))
+
+@alru_cache(maxsize=256)
+async def _fetch_page_text(url: str) -> str:
+    """Fetches a URL and returns its cleaned text. Errors propagate so failed fetches are not cached."""
+    log(f"\n> Fetching content from URL: {url}", "yellow")
+    html = bytearray()
+    # Range lets servers that honor it stop sending early; the loop enforces the cap for the rest
+    async with _HTTP.stream("GET", url, headers={'Accept': 'text/html,*/*;q=0.8', 'Range': f'bytes=0-{_MAX_PAGE_BYTES - 1}'}) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            html.extend(chunk)
+            if len(html) >= _MAX_PAGE_BYTES:
+                break
+        encoding = response.encoding or 'utf-8'
+    tree = LexborHTMLParser(html[:_MAX_PAGE_BYTES].decode(encoding, errors='replace'))
+    tree.strip_tags(["script", "style", "noscript", "svg"])
+    root = tree.body or tree.root
+    # Only the first 4000 characters are returned, so bound the cleanup work up front
+    text = root.text(separator='\n', strip=True)[:8000] if root else ""
+    return _WS_RE.sub('\n', text).strip()
+
 async def read_webpage(url: str) -> str:
     """Fetches and extracts clean text content from a URL."""
-    cprint(f"\n> Fetching content from URL: {url}", "yellow", file=sys.stderr)
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
     try:
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-            for script_or_style in soup(["script", "style"]):
-                script_or_style.decompose()
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            clean_text = '\n'.join(chunk for chunk in chunks if chunk)
-            cprint(f"> Successfully fetched and parsed content from {url}", "yellow", file=sys.stderr)
-            return f"Content from {url}:\n\n{clean_text[:4000]}..."
+        clean_text = await _fetch_page_text(_normalize_url(url))
+        log(f"> Successfully fetched and parsed content from {url}", "yellow")
+        return f"Content from {url}:\n\n{clean_text[:4000]}..."
     except httpx.RequestError as e:
         error_msg = f"Error fetching URL {e.request.url}: {e}"
-        cprint(f"> {error_msg}", "red", file=sys.stderr)
+        log(f"> {error_msg}", "red")
         return error_msg
     except Exception as e:
         error_msg = f"An unexpected error occurred while processing {url}: {e}"
-        cprint(f"> {error_msg}", "red", file=sys.stderr)
+        log(f"> {error_msg}", "red")
         return error_msg
 
+# Upper bound on pages per read_webpages call, so one tool message stays within a small expert's context
+MAX_BATCH_URLS = 5
+
+async def read_webpages(urls: list[str], max_concurrency: int = 5) -> str:
+    """Fetches several URLs concurrently and returns their combined content."""
+    unique_urls = list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+    if len(unique_urls) > MAX_BATCH_URLS:
+        log(f"> Reading only the first {MAX_BATCH_URLS} of {len(unique_urls)} requested URLs.", "yellow")
+    urls = unique_urls[:MAX_BATCH_URLS]
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def read_one(url: str) -> str:
+        async with semaphore:
+            return await read_webpage(url)
+
+    outputs = await asyncio.gather(*(read_one(url) for url in urls))
+    return "\n\n---\n\n".join(outputs) if outputs else "No URLs provided."
+
+# Domains (and their subdomains) left out of search results
+_BLOCKED_DOMAINS = frozenset({'substack.com'})
+
+def _is_blocked(url: str) -> bool:
+    labels = (urlparse(url).hostname or '').split('.')
+    return any('.'.join(labels[i:]) in _BLOCKED_DOMAINS for i in range(len(labels) - 1))
+
+def _google_search(query: str, num_results: int) -> list:
+    # googlesearch fetches lazily, so the iterator is consumed here on the worker thread
+    return [result for result in google_search(query, num_results=num_results, advanced=True) if not _is_blocked(result.url)]
+
+@alru_cache(maxsize=256)
+async def _search_results(query: str, num_results: int) -> list:
+    """Runs a Google search and returns the filtered results. Errors propagate so failed searches are not cached."""
+    log(f"\n> Performing Google search for: '{query}'", "yellow")
+    return await asyncio.get_running_loop().run_in_executor(_SEARCH_POOL, _google_search, query, num_results)
+
 async def search_web(query: str, num_results: int = 20) -> str:
     """Performs a Google search and returns a list of URLs."""
-    cprint(f"\n> Performing Google search for: '{query}'", "yellow", file=sys.stderr)
     try:
-        search_results_iterator = await asyncio.to_thread(
-            google_search, query, num_results=num_results, advanced=True
-        )
-        results = list(filter(lambda result: 'substack.com' not in result.url, list(search_results_iterator)))
+        results = await _search_results(query.lower().strip(), num_results)
         
         if not results:
             return "No results found."
         
         formatted_results = "\n".join([f"{sr}" for sr in results])
 
-        cprint(f"> Found {len(results)} URLs.", "yellow", file=sys.stderr)
+        log(f"> Found {len(results)} URLs.", "yellow")
         return f"Google Search Results for '{query}':\n\n{formatted_results}"
     except Exception as e:
-        cprint(f"Error during Google search: {e}", "red", file=sys.stderr)
+        log(f"Error during Google search: {e}", "red")
         return "An error occurred during the Google search."
 
+def _write_gz(path: str, data: bytes):
+    with gzip.open(path, 'wb', compresslevel=3) as f:
+        f.write(data)
+
+# Leading text of every llama_panel tool message, used to tell panel answers apart from gathered evidence
+PANEL_TOOL_PREFIX = "Using llama_panel("
+
+class ResponseCache:
+    """Caches panel responses by exact question, then by embedding similarity for paraphrased questions.
+
+    Both tiers are scoped to the evidence gathered so far (search and webpage outputs, not earlier panel
+    answers), so a cached answer is only reused when the panel is working from the same information.
+    """
+    EMBED_MODEL = 'nomic-embed-text'
+    THRESHOLD = 0.92
+    MAX_TEMPERATURE = 0.3
+
+    def __init__(self, max_entries: int = 256, max_scopes: int = 32):
+        self.max_entries, self.max_scopes = max_entries, max_scopes
+        self._exact = OrderedDict()
+        self._semantic = OrderedDict()
+        self._semantic_enabled = True
+
+    @staticmethod
+    def _normalize(question: str) -> str:
+        return " ".join(question.split()).lower()
+
+    @staticmethod
+    def _evidence_key(evidence: str) -> str:
+        return hashlib.sha256(evidence.encode()).hexdigest()
+
+    async def embed(self, question: str) -> Optional[list[float]]:
+        """Returns the unit-length embedding of a question, or None when the semantic tier is off."""
+        if not self._semantic_enabled:
+            return None
+        try:
+            response = await _OLLAMA.embeddings(model=self.EMBED_MODEL, prompt=self._normalize(question))
+        except (ollama.ResponseError, httpx.HTTPError) as e:
+            # Usually means the embedding model isn't pulled; fall back to exact matches only
+            log(f"  - Semantic cache disabled, could not embed with '{self.EMBED_MODEL}': {getattr(e, 'error', e)}", "red")
+            self._semantic_enabled = False
+            return None
+        norm = math.sqrt(sum(x * x for x in response['embedding'])) or 1.0
+        return [x / norm for x in response['embedding']]
+
+    def get(self, model: str, temperature: float, question: str, evidence: str, embedding: Optional[list[float]]) -> Optional[str]:
+        evidence_key = self._evidence_key(evidence)
+        key = (model, temperature, evidence_key, self._normalize(question))
+        if key in self._exact:
+            self._exact.move_to_end(key)
+            return self._exact[key]
+        if embedding is None:
+            return None
+        scope = (model, temperature, evidence_key)
+        if scope not in self._semantic:
+            return None
+        self._semantic.move_to_end(scope)
+        best_score, best_response = 0.0, None
+        for cached_embedding, cached_response in self._semantic[scope]:
+            score = sum(a * b for a, b in zip(embedding, cached_embedding))
+            if score > best_score:
+                best_score, best_response = score, cached_response
+        return best_response if best_score >= self.THRESHOLD else None
+
+    def put(self, model: str, temperature: float, question: str, evidence: str, embedding: Optional[list[float]], response: str):
+        evidence_key = self._evidence_key(evidence)
+        self._exact[(model, temperature, evidence_key, self._normalize(question))] = response
+        if len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+        if embedding is not None:
+            scope = (model, temperature, evidence_key)
+            self._semantic.setdefault(scope, deque(maxlen=self.max_entries)).append((embedding, response))
+            self._semantic.move_to_end(scope)
+            if len(self._semantic) > self.max_scopes:
+                self._semantic.popitem(last=False)
+
 class PanelMember:
-    def __init__(self, model_name: str, temperature: float):
+    def __init__(self, model_name: str, temperature: float, cache: Optional[ResponseCache] = None):
         self.model, self.temperature = model_name, temperature
-        self.client = ollama.AsyncClient()
+        # High-temperature panelists are there for diversity, so their answers are never reused
+        self.cache = cache if temperature <= ResponseCache.MAX_TEMPERATURE else None
 
-    async def query(self, question: str) -> str:
-        cprint(f"  - Querying panelist '{self.model}' (temp: {self.temperature:.2f})...", "cyan", file=sys.stderr)
+    async def query(self, question: str, context: str = "", embedding: Optional[list[float]] = None, evidence: Optional[str] = None) -> str:
+        # Cache hits are scoped to the evidence when given, else to the full context
+        evidence = context if evidence is None else evidence
+        if self.cache:
+            cached = self.cache.get(self.model, self.temperature, question, evidence, embedding)
+            if cached is not None:
+                log(f"  - Using cached response from panelist '{self.model}' (temp: {self.temperature:.2f}).", "cyan")
+                return cached
+        log(f"  - Querying panelist '{self.model}' (temp: {self.temperature:.2f})...", "cyan")
+        prompt = f"{question}\n\nContext from previous tool outputs:\n{context}" if context else question
         try:
-            response = await self.client.chat(model=self.model, messages=[{'role': 'user', 'content': question}], options={'temperature': self.temperature})
+            response = await _OLLAMA.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}], options={'temperature': self.temperature})
+            if self.cache:
+                self.cache.put(self.model, self.temperature, question, evidence, embedding, response['message']['content'])
             return response['message']['content']
         except ollama.ResponseError as e:
-            cprint(f"Error querying panelist {self.model}: {e.error}", "red", file=sys.stderr)
+            log(f"Error querying panelist {self.model}: {e.error}", "red")
             return f"Error: Could not get a response from model '{self.model}'."
 
+def panel_parallelism() -> int:
+    value = os.getenv('PANEL_PAR', '3')
+    try:
+        parallelism = int(value)
+    except ValueError:
+        parallelism = 0
+    if parallelism < 1:
+        raise argparse.ArgumentTypeError(f"Invalid PANEL_PAR: '{value}'. Use a positive integer.")
+    return parallelism
+
 class ExpertSystem:
     def __init__(self, expert_config: tuple[str, float], panel_configs: list[tuple[str, float]], max_reasoning_steps: int):
         self.expert_model, self.expert_temp = expert_config
-        self.client = ollama.AsyncClient()
         self.max_reasoning_steps = max_reasoning_steps
-        cprint("Initializing expert panel...", "green", file=sys.stderr)
-        self.panel = [PanelMember(name, temp) for name, temp in panel_configs]
-        cprint(f"Expert: {self.expert_model} (temp: {self.expert_temp})", "green", file=sys.stderr)
+        log("Initializing expert panel...", "green")
+        # Ollama serializes requests to the same model, so queue them here and cap overall parallelism
+        self._model_locks = defaultdict(asyncio.Lock)
+        self._global_sem = asyncio.Semaphore(panel_parallelism())
+        self.response_cache = ResponseCache()
+        self._prefix_tokens = None
+        self.panel = [PanelMember(name, temp, self.response_cache) for name, temp in panel_configs]
+        log(f"Expert: {self.expert_model} (temp: {self.expert_temp})", "green")
         panel_details = [f"{p.model} (temp: {p.temperature:.2f})" for p in self.panel]
-        cprint(f"Panel: {', '.join(panel_details)}", "green", file=sys.stderr)
+        log(f"Panel: {', '.join(panel_details)}", "green")
     
-    async def _query_panel(self, question: str, tool_outputs: list[str]) -> str:
+    async def _query_panel(self, question: str, conversation_history: list[dict]) -> str:
         # Combine all previous tool outputs as context for the panel
-        context = "\n\n".join(tool_outputs)
-        panel_prompt = f"{question}\n\nContext from previous tool outputs:\n{context}" if context else question
-        cprint(f"\n> Consulting the panel with the question: '{question}'", "blue", file=sys.stderr)
-        tasks = [member.query(panel_prompt) for member in self.panel]
+        tool_contents = [m['content'] for m in conversation_history if m['role'] == 'tool']
+        context = "\n\n".join(tool_contents)
+        # Earlier panel answers change on every consult, so cache lookups only consider search/webpage outputs
+        evidence = "\n\n".join(c for c in tool_contents if not c.startswith(PANEL_TOOL_PREFIX))
+        log(f"\n> Consulting the panel with the question: '{question}'", "blue")
+        # Embed the question once and share it with every panelist that uses the cache
+        embedding = await self.response_cache.embed(question) if any(member.cache for member in self.panel) else None
+        async def query_member(member: PanelMember) -> str:
+            async with self._model_locks[member.model], self._global_sem:
+                return await member.query(question, context, embedding, evidence)
+
+        tasks = [query_member(member) for member in self.panel]
         panel_raw_responses = await asyncio.gather(*tasks, return_exceptions=True)
         panel_responses = [f"Response from '{member.model}':\n{resp}" if not isinstance(resp, Exception) else f"Exception from panelist {member.model}: {resp}" for member, resp in zip(self.panel, panel_raw_responses)]
         tool_output = "\n\n---\n\n".join(panel_responses)
-        cprint("> Panel consultation complete.", "blue", file=sys.stderr)
+        log("> Panel consultation complete.", "blue")
         return tool_output
 
+    async def _warm_expert_prefix(self):
+        """Prefills the expert's KV cache with the system prompt so every step reuses it."""
+        if self._prefix_tokens is not None:
+            return
+        # Same leading message as the reasoning loop, so llama.cpp's prompt cache matches it.
+        # num_predict 0 means unlimited in Ollama, so generate a single token instead.
+        response = await _OLLAMA.chat(
+            model=self.expert_model,
+            messages=[{'role': 'system', 'content': EXPERT_SYSTEM_PROMPT}],
+            options={'num_predict': 1},
+            keep_alive=EXPERT_KEEP_ALIVE
+        )
+        # prompt_eval_count only covers uncached tokens, so fall back to a ~4 chars/token estimate
+        # when the model already had the prompt cached from an earlier run
+        self._prefix_tokens = max(response.get('prompt_eval_count') or 0, len(EXPERT_SYSTEM_PROMPT) // 4)
+        log(f"Expert system prompt cached ({self._prefix_tokens} tokens pinned).", "green")
+
+    async def _chat_expert(self, messages: list[dict], thinking: bool) -> tuple[str, str]:
+        """Streams the expert's reply and stops generation as soon as it forms a complete JSON object."""
+        content, expert_thinking = [], []
+        stream = await _OLLAMA.chat(
+            model=self.expert_model,
+            messages=messages,
+            format='json',
+            # num_keep pins the system prompt in the KV cache when the context shifts
+            options={'temperature': self.expert_temp, 'think': thinking, 'num_keep': self._prefix_tokens},
+            keep_alive=EXPERT_KEEP_ALIVE,
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                content.append(chunk['message']['content'])
+                if chunk['message'].get('thinking'):
+                    expert_thinking.append(chunk['message']['thinking'])
+                # Only a chunk containing a closing brace can complete the object
+                if '}' in chunk['message']['content']:
+                    try:
+                        orjson.loads(''.join(content))
+                        break
+                    except orjson.JSONDecodeError:
+                        pass
+        finally:
+            # Closing the stream drops the connection, which makes Ollama stop generating
+            await stream.aclose()
+        return ''.join(content), ''.join(expert_thinking)
+
     async def get_consensus_answer(self, user_prompt: str, verbose: bool = False, thinking: bool = False, write_convo: bool = False):
-        conversation_history = [{'role': 'system', 'content': EXPERT_SYSTEM_PROMPT + f"Current date: {datetime.now()}"}, {'role': 'user', 'content': user_prompt}]
-        tool_outputs = []
+        await self._warm_expert_prefix()
+        # The date goes in its own message so the system prompt stays byte-identical and cacheable
+        conversation_history = [{'role': 'system', 'content': EXPERT_SYSTEM_PROMPT}, {'role': 'user', 'content': f"Current date: {datetime.now()}"}, {'role': 'user', 'content': user_prompt}]
         for i in range(self.max_reasoning_steps):
-            cprint(f"\n--- Expert Reasoning Step {i+1}/{self.max_reasoning_steps} ---", "magenta", file=sys.stderr)
-            response = await self.client.chat(
-                model=self.expert_model,
-                messages=conversation_history,
-                format='json',
-                options={'temperature': self.expert_temp, 'think': thinking}
-            )
-            assistant_message = response['message']['content']
-            if verbose and 'thinking' in response['message']:
-                print(f"\n--- Expert Thinking ---\n{response['message']['thinking']}\n")
+            log(f"\n--- Expert Reasoning Step {i+1}/{self.max_reasoning_steps} ---", "magenta")
+            assistant_message, expert_thinking = await self._chat_expert(conversation_history, thinking)
+            if verbose and expert_thinking:
+                print(f"\n--- Expert Thinking ---\n{expert_thinking}\n")
             conversation_history.append({'role': 'assistant', 'content': assistant_message})
 
             try:
-                tool_call = json.loads(assistant_message)
-                tool_name = tool_call.get("tool")
-                tool_reason = tool_call.get("reason", None)
-                cprint(f"> Expert wants to use tool: '{tool_name}'", "yellow", file=sys.stderr)
-                if tool_reason:
-                    cprint(f"> Reason for tool selection: {tool_reason}", "yellow", file=sys.stderr)
-                
-                tool_output = None
-                if tool_name == "llama_panel":
-                    tool_output = f"Using llama_panel({tool_call.get('question', '')}) with reason '{tool_reason}'.\nOutput:\n"
-                    # Pass all previous tool outputs as context
-                    panel_output = await self._query_panel(tool_call.get("question", ""), tool_outputs)
-                    tool_output += panel_output
-                elif tool_name == "search_web":
-                    tool_output = f"Using search_web({tool_call.get('query', '')}) with reason '{tool_reason}'.\nOutput:\n"
-                    search_output = await search_web(tool_call.get("query", ""))
-                    tool_output += search_output
-                elif tool_name == "read_webpage":
-                    tool_output = f"Using read_webpage({tool_call.get('url', '')}) with reason '{tool_reason}'.\nOutput:\n"
-                    webpage_output = await read_webpage(tool_call.get("url", ""))
-                    tool_output += webpage_output
-                elif tool_name == "final_answer":
-                    print(tool_call.get("answer", "No answer provided."))
-                    if write_convo:
-                        timestamp = time.strftime("%Y%m%d-%H%M%S")
-                        fname = f"llama-panel-{timestamp}.convo"
-                        with open(fname, "w") as f:
-                            json.dump(conversation_history, f, indent=2)
-                        cprint(f"\nConversation history written to {fname}", "green", file=sys.stderr)
-                    return
+                tool_call = _TOOL_CALL_DECODER.decode(assistant_message)
+            except msgspec.ValidationError as e:
+                log(f"Error: Expert made an invalid tool call: {e}", "red")
+                print(assistant_message)
+                return
+            except msgspec.DecodeError:
+                log("Warning: Model did not return valid JSON. Treating response as final.", "red")
+                print(assistant_message)
+                return
+
+            tool_name = type(tool_call).__struct_config__.tag
+            tool_reason = tool_call.reason
+            log(f"> Expert wants to use tool: '{tool_name}'", "yellow")
+            if tool_reason:
+                log(f"> Reason for tool selection: {tool_reason}", "yellow")
+
+            if isinstance(tool_call, LlamaPanel):
+                question = tool_call.question or ""
+                tool_output = f"{PANEL_TOOL_PREFIX}{question}) with reason '{tool_reason}'.\nOutput:\n"
+                # Pass all previous tool outputs as context
+                panel_output = await self._query_panel(question, conversation_history)
+                tool_output += panel_output
+            elif isinstance(tool_call, SearchWeb):
+                query = tool_call.query or ""
+                tool_output = f"Using search_web({query}) with reason '{tool_reason}'.\nOutput:\n"
+                search_output = await search_web(query)
+                tool_output += search_output
+            elif isinstance(tool_call, ReadWebpage):
+                url = tool_call.url or ""
+                tool_output = f"Using read_webpage({url}) with reason '{tool_reason}'.\nOutput:\n"
+                webpage_output = await read_webpage(url)
+                tool_output += webpage_output
+            elif isinstance(tool_call, ReadWebpages):
+                urls = [tool_call.urls] if isinstance(tool_call.urls, str) else tool_call.urls or []
+                tool_output = f"Using read_webpages({', '.join(urls)}) with reason '{tool_reason}'.\nOutput:\n"
+                webpages_output = await read_webpages(urls)
+                tool_output += webpages_output
+            else:
+                if tool_call.answer is None:
+                    print("No answer provided.")
+                elif isinstance(tool_call.answer, str):
+                    print(tool_call.answer)
                 else:
-                    cprint(f"Error: Expert called an unknown tool: {tool_name}", "red", file=sys.stderr)
-                    print(response)
-                    return
-                
-                if tool_output:
-                    conversation_history.append({'role': 'tool', 'content': tool_output})
-                    tool_outputs.append(tool_output)
-            except json.JSONDecodeError:
-                cprint("Warning: Model did not return valid JSON. Treating response as final.", "red", file=sys.stderr)
-                print(response)
+                    print(orjson.dumps(tool_call.answer, option=orjson.OPT_INDENT_2).decode())
+                if write_convo:
+                    timestamp = time.strftime("%Y%m%d-%H%M%S")
+                    fname = f"llama-panel-{timestamp}.convo.gz"
+                    data = orjson.dumps(conversation_history, option=orjson.OPT_INDENT_2)
+                    await asyncio.to_thread(_write_gz, fname, data)
+                    log(f"\nConversation history written to {fname}", "green")
                 return
-        
-        cprint("\n--- Max Reasoning Steps Reached ---", "red", attrs=["bold"], file=sys.stderr)
+
+            conversation_history.append({'role': 'tool', 'content': tool_output})
+
+        log("\n--- Max Reasoning Steps Reached ---", "red", bold=True)
         print("The expert could not reach a consensus in the allowed number of steps.")
 
+# 'model:temp' where the model name may itself contain colons (e.g. 'gemma3:4b:0.5')
+_MODEL_TEMP_RE = re.compile(r'(?P<model>.+):(?P<temp>\d+(?:\.\d*)?|\.\d+)')
+
 def parse_model_temp(value: str) -> tuple[str, float]:
-    try:
-        parts = value.rsplit(':', 1)
-        if len(parts) == 2 and parts[1].replace('.', '', 1).isdigit():
-            return parts[0], float(parts[1])
-        raise ValueError()
-    except (ValueError, IndexError):
+    match = _MODEL_TEMP_RE.fullmatch(value)
+    if not match:
         raise argparse.ArgumentTypeError(f"Invalid format: '{value}'. Use 'model_name:temperature'.")
+    return match['model'], float(match['temp'])
 
 async def main():
     parser = argparse.ArgumentParser(description="Llama Panel: Chat with an AI panel.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -206,7 +497,7 @@ async def main():
     parser.add_argument("--max-steps", type=int, default=20, help="Maximum reasoning steps for the expert system.")
     parser.add_argument("--verbose", action="store_true", help="Print expert and panel thinking to stdout.")
     parser.add_argument("--thinking", action="store_true", help="Enable expert model thinking output if supported.")
-    parser.add_argument("--write-convo", action="store_true", help="Write conversation history to a file after final answer.")
+    parser.add_argument("--write-convo", action="store_true", help="Write conversation history to a gzipped JSON file after final answer.")
     args = parser.parse_args()
 
     panel_configs = [parse_model_temp(p) for p in args.panel]
@@ -216,22 +507,24 @@ async def main():
         if args.question:
             await system.get_consensus_answer(args.question, args.verbose, args.thinking, args.write_convo)
         else:
-            cprint("\nWelcome to Llama Panel Interactive Chat!", "blue", attrs=["bold"])
+            log("\nWelcome to Llama Panel Interactive Chat!", "blue", bold=True, file=sys.stdout)
             while True:
                 user_input = input("\n👤 You: ")
                 if user_input.lower() in ["exit", "quit"]: break
                 await system.get_consensus_answer(user_input, args.verbose, args.thinking, args.write_convo)
-            cprint("Goodbye!", "blue")
+            log("Goodbye!", "blue", file=sys.stdout)
     except (ollama.ResponseError, argparse.ArgumentTypeError) as e:
-        cprint(f"\nFatal Error: {getattr(e, 'error', str(e))}", "red", attrs=["bold"], file=sys.stderr)
+        log(f"\nFatal Error: {getattr(e, 'error', str(e))}", "red", bold=True)
         sys.exit(1)
     except Exception as e:
-        cprint(f"\nAn unexpected error occurred: {e}", "red", attrs=["bold"], file=sys.stderr)
+        log(f"\nAn unexpected error occurred: {e}", "red", bold=True)
         sys.exit(1)
+    finally:
+        await _HTTP.aclose()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        cprint("\nGoodbye!", "blue")
+        log("\nGoodbye!", "blue", file=sys.stdout)
         sys.exit(0)
\ No newline at end of file